@@ -3,17 +3,29 @@
 
 import calendar
 import collections
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
 import csv
 import datetime
-from itertools import islice
+import functools
+import gzip
+import hashlib
+import io
+from itertools import dropwhile, islice
+import json
 import logging
+import multiprocessing
+import os
 import re
-from urllib.parse import urljoin
+import tempfile
+import threading
+from urllib.parse import urljoin, urlsplit
 
 import click
 from click_datetime import Datetime
 from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter, Retry
 
 
 INDEX_URI = 'https://en.wikipedia.org/wiki/Wikipedia:Articles_for_deletion'
@@ -22,9 +34,34 @@ CURRENT_ID = 'Current_discussions'
 OLD_ID = 'Old_discussions'
 
 OUTPUT = 'afd-bios-{}.csv'
+
+WORKERS = 16
+TIMEOUT = 30
+CHUNK_SIZE = 1 << 16
+
+# The downloaded log pages are parsed on this many processes, so parsing isn't
+# held up by the GIL. With only one, or only one page to parse, they're parsed
+# in this process instead.
+PROCESSES = os.cpu_count() or 1
+
+# No more than this many connections are opened to the server. If there are
+# more workers than this, they wait their turn for one that's been kept alive
+# instead of opening (and then throwing away) connections of their own.
+CONNECTIONS = 32
+
+# Failed requests, including being rate limited, are retried a few times,
+# backing off a little more each time.
+RETRY = Retry(total=3, backoff_factor=0.5,
+              status_forcelist=(429, 500, 502, 503, 504))
+
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=CONNECTIONS,
+                                      pool_maxsize=CONNECTIONS,
+                                      pool_block=True,
+                                      max_retries=RETRY))
+
 HEADER = ('AfD Date', 'Entry', 'Page Link', 'AfD Link', 'Hits', 'Keep')
 
-WP_TAG = re.compile(r'WP:\w+')
 BIO_TAGS = frozenset([
     'Authors-related',
     'Businesspeople-related',
@@ -48,75 +85,117 @@ BIO_TAGS = frozenset([
     'WP:TEACHER',
 ])
 
-
-def is_bio(tokens, bio_tags=BIO_TAGS):
-    """This returns true if the bag-of-words token set indicates that the entry
-    is a biography."""
-    return tokens & bio_tags
+# This finds all of the BIO_TAGS in one pass, ignoring case. The WP: tags
+# match the way WP:\w+ would, and the rest only match as whole
+# whitespace-delimited words. The tags themselves are matched as ASCII, so
+# that letters like ſ and ı don't fold onto them, but the text around
+# them is still Unicode, where a non-breaking space is whitespace.
+BIO_PATTERN = re.compile(r'(?a:WP:(?:{}))(?!\w)|(?<!\S)(?a:{})(?!\S)'.format(
+    '|'.join(re.escape(tag[3:]) for tag in sorted(BIO_TAGS)
+             if tag.startswith('WP:')),
+    '|'.join(re.escape(tag) for tag in sorted(BIO_TAGS)
+             if not tag.startswith('WP:')),
+    ), re.IGNORECASE)
+
+# Each of the BIO_TAGS gets a bit, so the hits for an entry can be kept in an
+# int. The bits are in sorted order, which is the order they're written out.
+BIO_TAG_BITS = [(tag, 1 << i) for i, tag in enumerate(sorted(BIO_TAGS))]
+BIO_BITS = {tag.lower(): bit for tag, bit in BIO_TAG_BITS}
+BIO_MASK = (1 << len(BIO_TAG_BITS)) - 1
+
+# We never look nodes up by id, and comments and processing instructions are
+# never scanned, so don't make the parser keep track of them. Blank text has
+# to stay though, or the words on either side of it would run together.
+PARSER_OPTIONS = {
+    'collect_ids': False,
+    'no_network': True,
+    'remove_comments': True,
+    'remove_pis': True,
+}
+
+HEADLINE = etree.XPath('(.//span[@class="mw-headline"])[1]')
+HEADLINE_LINK = etree.XPath('span[@class="mw-headline"]/a')
+LINKS = etree.XPath('.//a')
+SPAN_WITH_ID = etree.XPath('span[@id=$id]')
+TEXT_NODE = etree.XPath('(descendant-or-self::*[text()=$text])[1]')
+
+# Each thread that parses pages keeps its own parser here.
+PARSERS = threading.local()
+
+
+def is_bio(hits, bio_mask=BIO_MASK):
+    """This returns true if the bitmask of hits indicates that the entry is a
+    biography."""
+    return hits & bio_mask
+
+
+def tag_names(hits):
+    """This returns the names of the BIO_TAGS in the bitmask of hits."""
+    return [tag for tag, bit in BIO_TAG_BITS if hits & bit]
 
 
 def is_header(node):
     """Returns True-ish if node is a header (h3 with an a inside)."""
     return ((node.tag == 'h3' and
-             node.find('./span[@class="mw-headline"]/a') is not None) or
+             len(HEADLINE_LINK(node)) > 0) or
             (node.tag == 'div' and
              'boilerplate' in node.get('class', '') and
              'xfd-closed' in node.get('class')))
 
 
-def has_span(id_value, el):
-    """Does the element contain span[@id=id_value]?"""
-    for span in el.findall('span'):
-        if span.get('id') == id_value:
-            return True
-    return False
-
-
-def child_matching(el, f, start=0):
-    """Return the index of the first child matching f."""
-    i = start
-    while i < len(el):
-        if f(el[i]):
-            return i
-        i += 1
-    return None
+def is_content(node):
+    """Returns True if node is #mw-content-text's parser output div."""
+    if node is None or node.tag != 'div':
+        return False
+    parent = node.getparent()
+    return (node.get('class') == 'mw-parser-output' and
+            parent is not None and parent.get('id') == 'mw-content-text')
 
 
-def next_tag(parent, tag, start=0):
-    """Find the index of the next tag or None."""
-    return child_matching(parent, lambda e: e.tag == tag, start=start)
+def has_span(id_value, el):
+    """Does the element contain span[@id=id_value]?"""
+    return len(SPAN_WITH_ID(el, id=id_value)) > 0
 
 
 def all_text(el):
-    """Return all text content."""
-    text = el.text if el.text is not None else ''
-    tail = el.tail if el.tail is not None else ''
-    return text + ''.join(all_text(c) for c in el) + tail
-
+    """Return all text content, including el's own tail."""
+    return etree.tostring(el, method='text', encoding='unicode')
 
-def next_h3(parent, start=0):
-    """Find the index of the next h3 or None."""
-    return next_tag(parent, 'h3', start)
 
+@functools.lru_cache(maxsize=32)
+def site_root(uri):
+    """Returns the scheme and host of uri, without a trailing slash."""
+    parts = urlsplit(uri)
+    return '{}://{}'.format(parts.scheme, parts.netloc)
 
-def find_h3(parent, id_value, start=0):
-    """Find the index of an h3 that has_span id_value or raise hell."""
-    i = child_matching(
-        parent,
-        lambda e: e.tag == 'h3' and has_span(id_value, e),
-        start=start,
-    )
-    if i is None:
-        raise Exception('Unable to find #{}.'.format(id_value))
-    return i
 
-
-def find_ul(parent, start=0):
-    """Find the next ul."""
-    i = child_matching(parent, lambda e: e.tag == 'ul', start=start)
-    if i is None:
-        raise Exception('Unable to find list.')
-    return i
+def join_uri(base_uri, href):
+    """\
+    Does the same thing as urljoin(base_uri, href), but quickly for the
+    absolute and root-relative links that almost all of Wikipedia's are.
+
+    >>> base = 'https://en.wikipedia.org/wiki/Main_Page'
+    >>> hrefs = ['https://example.org/a', '/wiki/Foo', '//example.org/b',
+    ...          '?action=history', '#Old', 'Bar', '']
+    >>> for href in hrefs:
+    ...     print(join_uri(base, href))
+    https://example.org/a
+    https://en.wikipedia.org/wiki/Foo
+    https://example.org/b
+    https://en.wikipedia.org/wiki/Main_Page?action=history
+    https://en.wikipedia.org/wiki/Main_Page#Old
+    https://en.wikipedia.org/wiki/Bar
+    https://en.wikipedia.org/wiki/Main_Page
+    >>> all(join_uri(base, href) == urljoin(base, href) for href in hrefs)
+    True
+    """
+    if not href:
+        return base_uri
+    if href.startswith(('https://', 'http://')):
+        return href
+    if href.startswith('/') and not href.startswith('//'):
+        return site_root(base_uri) + href
+    return urljoin(base_uri, href)
 
 
 def find_links(parent, base_uri):
@@ -125,10 +204,10 @@ def find_links(parent, base_uri):
 
     This also filters out any links whose text are just digits.
     """
-    for a in parent.findall('.//a'):
+    for a in LINKS(parent):
         href = a.get('href')
         if href is not None and not a.text.isdigit():
-            yield urljoin(base_uri, href)
+            yield join_uri(base_uri, href)
 
 
 def critical(*args, **kwargs):
@@ -155,23 +234,105 @@ def exception(*args, **kwargs):
     logging.getLogger('afd').exception(*args, **kwargs)
 
 
-def get_content(uri, parser, links=False):
+def setup_logging(level):
+    """Sets up logging and the level for the afd logger."""
+    logging.basicConfig()
+    logging.getLogger('afd').setLevel(level)
+
+
+def fetch(uri):
+    """\
+    Retrieves the document at uri and returns the body as bytes.
+
+    This goes through SESSION, so connections to the server are kept alive
+    and reused across requests (and threads).
+    """
+    info('retreiving <{}>'.format(uri))
+    r = SESSION.get(uri, timeout=TIMEOUT)
+    return r.content
+
+
+def fetch_cached(uri, cache_dir):
+    """\
+    Retrieves the document at uri, keeping a copy in cache_dir.
+
+    If there's already a copy, the request is made conditional on its ETag
+    and Last-Modified headers, and the copy is returned if the server says
+    it hasn't changed.
+    """
+    key = os.path.join(cache_dir, hashlib.sha1(uri.encode('utf8')).hexdigest())
+    body_file = key + '.html'
+    headers_file = key + '.json'
+
+    headers = {}
+    if os.path.exists(body_file) and os.path.exists(headers_file):
+        try:
+            with open(headers_file) as fin:
+                headers = json.load(fin)
+        except (OSError, ValueError):
+            warning('ignoring unreadable cache file {}'.format(headers_file))
+            headers = {}
+
+    info('retreiving <{}>'.format(uri))
+    r = SESSION.get(uri, headers=headers, timeout=TIMEOUT)
+    if r.status_code == 304:
+        debug('using cached copy of <{}>'.format(uri))
+        with open(body_file, 'rb') as fin:
+            return fin.read()
+
+    headers = {}
+    if 'ETag' in r.headers:
+        headers['If-None-Match'] = r.headers['ETag']
+    if 'Last-Modified' in r.headers:
+        headers['If-Modified-Since'] = r.headers['Last-Modified']
+    if r.ok and headers:
+        # The headers go in last, so they're never used with a body that
+        # didn't get written.
+        replace_file(body_file, r.content)
+        replace_file(headers_file, json.dumps(headers).encode('utf8'))
+
+    return r.content
+
+
+def replace_file(filename, data):
+    """\
+    Writes data to filename by way of a temporary file next to it, so
+    filename is never left half written.
+    """
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(data)
+        os.replace(temp_file, filename)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+
+def get_content(uri, links=False):
     """\
     Retrieves the document at uri and returns #mw-content-text.
 
     Optionally, it also returns the link elements as a dict.
+
+    The document is parsed as it's read off the connection, and parsing
+    stops as soon as #mw-content-text is finished. The rest of the page is
+    still read, but not parsed, so the connection can go back to the pool.
     """
     info('retreiving <{}>'.format(uri))
-    r = requests.get(uri)
-    root = etree.fromstring(r.content, parser)
-    content = root.find('.//div[@id="mw-content-text"]/'
-                        'div[@class="mw-parser-output"]')
+    content = None
+    with SESSION.get(uri, stream=True, timeout=TIMEOUT) as r:
+        r.raw.decode_content = True
+        events = parse_events(r.raw)
+        link_dict = read_links(events)
+        for event, el in events:
+            if event == 'end' and is_content(el):
+                content = el
+                break
+        for _ in r.raw.stream(CHUNK_SIZE):
+            pass
 
     if links:
-        link_dict = {
-            link.get('rel'): link.get('href')
-            for link in root.iter('link')
-            }
         retval = (link_dict, content)
     else:
         retval = content
@@ -179,24 +340,111 @@ def get_content(uri, parser, links=False):
     return retval
 
 
-def iter_h3_ul_links(parent, id_value, base_uri, start=0):
-    """Finds h3/span[@id=id_value], then the next ul and returns all the
-    links found in the list."""
-    cursor = start
-    cursor = find_h3(parent, id_value, cursor)
-    cursor = find_ul(parent, cursor)
-    return (cursor, find_links(parent[cursor], base_uri))
+def html_parser():
+    """\
+    Takes this thread's HTML pull parser, or makes a new one if it doesn't
+    have one to spare.
+
+    lxml's parsers can't be shared between threads, but a thread can reuse
+    its own from one document to the next instead of setting up a new one.
+    While a document is being parsed, its parser is taken out of PARSERS,
+    so two documents open on the same thread never share one.
+    """
+    parser = getattr(PARSERS, 'parser', None)
+    if parser is None:
+        return etree.HTMLPullParser(events=('start', 'end'), **PARSER_OPTIONS)
+    PARSERS.parser = None
+    return parser
+
+
+def parse_events(source):
+    """\
+    Parses the HTML in source and yields the start and end events as they
+    happen.
+
+    The parser is only given back for reuse once the document has been
+    read to the end. If it isn't, the parser is still in the middle of it,
+    so it's thrown away.
+    """
+    parser = html_parser()
+    for chunk in iter(functools.partial(source.read, CHUNK_SIZE), b''):
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    events = list(parser.read_events())
+    PARSERS.parser = parser
+    yield from events
+
+
+def read_links(events):
+    """\
+    Reads parse_events up to the start of the body and returns the link
+    elements as a dict.
+    """
+    link_dict = {}
+    for event, el in events:
+        if event != 'start':
+            continue
+        if el.tag == 'link':
+            link_dict[el.get('rel')] = el.get('href')
+        elif el.tag == 'body':
+            break
+    return link_dict
+
+
+def iter_content(events):
+    """\
+    Reads parse_events and yields the children of #mw-content-text as each
+    one is finished.
+
+    Everything before a header is dropped from the tree once the header has
+    been yielded, since by then the section before it has been processed.
+    This keeps only about one section of the page in memory at a time.
+    """
+    content = None
+    for event, el in events:
+        if event != 'end':
+            continue
+        parent = el.getparent()
+        if content is None:
+            if not is_content(parent):
+                continue
+            content = parent
+        elif parent is not content:
+            continue
+
+        yield el
+
+        if is_header(el):
+            while el.getprevious() is not None:
+                del content[0]
+
 
+def iter_h3_ul_links(content, id_values, base_uri):
+    """For each of id_values in turn, finds h3/span[@id=id_value] in
+    content, then the next ul and yields all the links found in the list.
+    The children of content are only walked once."""
+    children = content.iterchildren('h3', 'ul')
+    for id_value in id_values:
+        for child in children:
+            if child.tag == 'h3' and has_span(id_value, child):
+                break
+        else:
+            raise Exception('Unable to find #{}.'.format(id_value))
 
-def get_afd_index(base_uri, parser):
+        for child in children:
+            if child.tag == 'ul':
+                yield from find_links(child, base_uri)
+                break
+        else:
+            raise Exception('Unable to find list.')
+
+
+def get_afd_index(base_uri):
     """This retrieves the AfD index page and returns the links to the weekly
     pages."""
-    content = get_content(base_uri, parser)
-    cursor = 0
-    cursor, links = iter_h3_ul_links(content, CURRENT_ID, INDEX_URI, cursor)
-    yield from links
-    _, links = iter_h3_ul_links(content, OLD_ID, INDEX_URI, cursor)
-    yield from links
+    content = get_content(base_uri)
+    yield from iter_h3_ul_links(content, (CURRENT_ID, OLD_ID), INDEX_URI)
 
 
 def break_by(fn, xs):
@@ -204,59 +452,73 @@ def break_by(fn, xs):
     This breaks xs into chunks. The first item of each chunk passed to fn
     should return True. Other items False.
     """
-    accum = collections.deque()
+    accum = []
 
     for x in xs:
         if fn(x) and accum:
-            yield accum.copy()
-            accum.clear()
+            yield accum
+            accum = []
         accum.append(x)
 
     if accum:
-        yield accum.copy()
+        yield accum
 
 
 def find_text_node(parent, text):
     """
     This returns the first node under parent whose text property == text.
     """
-    node = None
-    q = collections.deque([parent])
-
-    while len(q) > 0:
-        current = q.popleft()
-        if current.text == text:
-            node = current
-            break
-        q.extend(list(current))
-
-    return node
+    nodes = TEXT_NODE(parent, text=text)
+    return nodes[0] if nodes else None
 
 
-def process_text(node, tokens, tags):
-    """This gets tags and tokens from node and adds them to the set."""
-    text = all_text(node)
-    tags |= set(WP_TAG.findall(text))
-    tokens |= set(text.split())
+def process_text(*nodes, findall=BIO_PATTERN.findall, bio_bits=BIO_BITS):
+    """\
+    This returns the bitmask of the BIO_TAGS found in nodes.
+
+    The nodes' text is scanned in one go. It's joined with spaces, so tags
+    can't match across the boundaries between nodes.
+
+    >>> def hits(*texts):
+    ...     nodes = [etree.fromstring('<p>{}</p>'.format(text))
+    ...              for text in texts]
+    ...     return tag_names(process_text(*nodes))
+    >>> hits('Keep, meets wp:bio.')
+    ['WP:BIO']
+    >>> hits('WP:NſPORT'), hits('WP:ſPORT'), hits('WP:BİO')
+    ([], [], [])
+    >>> hits('See WP:BIOGRAPHY.')
+    []
+    >>> hits('Note: This discussion has been included in the list of '
+    ...      'Businesspeople-related deletion discussions.')
+    ['Businesspeople-related']
+    >>> hits('WP:', 'BIO')
+    []
+    """
+    hits = 0
+    text = ' '.join(all_text(node) for node in nodes)
+    for match in findall(text):
+        hits |= bio_bits[match.lower()]
+    return hits
 
 
 def get_afds(afd_date, content):
     """Look through the AfDs on the page and yield
-    (date_of_afd, title, link, afd link, tags, keep_flag). """
+    (date_of_afd, title, link, afd link, hits, keep_flag). """
     afd_date = afd_date.strftime('%Y-%m-%d')
     count = 0
     for section in break_by(is_header, content):
         if section[0].tag == 'div' and 'xfd-closed' in section[0].get('class'):
-            section = collections.deque(section[0])
-            while section and section[0].tag != 'h3':
-                section.popleft()
+            section = list(dropwhile(lambda el: el.tag != 'h3', section[0]))
             if not section:
                 break
 
-        h3 = section.popleft()
+        section = iter(section)
+        h3 = next(section)
         if h3.tag != 'h3':
             continue
-        span = h3.find('.//span[@class="mw-headline"]')
+        nodes = HEADLINE(h3)
+        span = nodes[0] if nodes else None
         try:
             if len(span) == 0:
                 title = span.text
@@ -273,28 +535,26 @@ def get_afds(afd_date, content):
         debug('title: "%s"', title)
 
         afd_link = None
-        tags = set()
-        tokens = set()
+        hits = 0
 
-        while len(section) > 0:
-            menu = section.popleft()
+        for menu in section:
             afd_node = find_text_node(menu, 'View AfD')
             if afd_node is None:
-                process_text(menu, tokens, tags)
+                hits |= process_text(menu)
             else:
                 afd_link = afd_node.get('href')
                 break
 
-        for el in section:
-            process_text(el, tokens, tags)
+        hits |= process_text(*section)
 
         links = (page_link, afd_link)
 
         count += 1
-        yield (afd_date, title, links, tags, tokens, keep)
+        yield (afd_date, title, links, hits, keep)
     info('yielded %d links', count)
 
 
+@functools.lru_cache(maxsize=4096)
 def url_to_date(url):
     """This parses a URL, taking the last part and parsing it to a datetime."""
     parts = url.split('/')
@@ -302,29 +562,115 @@ def url_to_date(url):
     return datetime.datetime.strptime(date_path, '%Y_%B_%d')
 
 
-def get_log_page(url, parser):
+def get_log_page(url):
     """Get a daily log page and return the links from it."""
-    links, content = get_content(url, parser, links=True)
+    yield from read_log_page(url, fetch(url))
+
+
+def read_log_page(url, body):
+    """\
+    Parse an already retrieved daily log page and return the links from it.
+
+    The page is parsed as a stream, so the whole tree is never built.
+    """
+    events = parse_events(io.BytesIO(body))
+    links = read_links(events)
+    content = iter_content(events)
     page_date = url_to_date(links['canonical'])
-    for date, title, links, tags, tokens, keep in get_afds(page_date, content):
-        bio_tags = is_bio(tags | tokens)
-        if bio_tags:
+    for date, title, links, hits, keep in get_afds(page_date, content):
+        bio_hits = is_bio(hits)
+        if bio_hits:
             yield (
                 date,
                 title,
-                urljoin(url, links[0]),
-                urljoin(url, links[1]) if links[1] is not None else None,
-                ' '.join(sorted(bio_tags)),
+                join_uri(url, links[0]),
+                join_uri(url, links[1]) if links[1] is not None else None,
+                ' '.join(tag_names(bio_hits)),
                 keep,
                 )
 
 
-def afd_bios(root_url, parser):
+def parse_log_page(url, body):
+    """\
+    This returns the links from a daily log page as a list, so they can be
+    sent back from another process.
+    """
+    return list(read_log_page(url, body))
+
+
+def iter_downloads(executor, get, urls, ahead):
+    """\
+    Starts downloading urls with get on executor and yields each url with
+    the future for its download, in order.
+
+    Only ahead downloads are started to begin with. Each time one is handed
+    on, the next is started, so the downloaded pages can't pile up faster
+    than they're read. The futures aren't kept after they're handed on.
+    """
+    urls = iter(urls)
+    downloads = collections.deque(
+        (url, executor.submit(get, url)) for url in islice(urls, ahead))
+    while downloads:
+        yield downloads.popleft()
+        for url in islice(urls, 1):
+            downloads.append((url, executor.submit(get, url)))
+
+
+def get_log_pages(urls, workers=WORKERS, cache_dir=None,
+                  processes=PROCESSES):
+    """\
+    Get a sequence of daily log pages and return the links from them.
+
+    The pages are downloaded concurrently on a pool of threads and handed to
+    a pool of processes to parse as they come in. The links still come out
+    in the order the pages are given. If cache_dir is given, the pages are
+    cached there between runs.
+    """
+    if cache_dir is None:
+        get = fetch
+    else:
+        get = functools.partial(fetch_cached, cache_dir=cache_dir)
+
+    urls = list(urls)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloads = iter_downloads(executor, get, urls, 2 * workers)
+        if processes <= 1 or len(urls) <= 1:
+            for url, download in downloads:
+                yield from read_log_page(url, download.result())
+            return
+
+        # The workers are spawned rather than forked, since the download
+        # threads are already running, so they have to set up logging
+        # themselves. Only a couple of pages per process are handed over at a
+        # time, and while waiting on the next download, the rows from the
+        # pages already parsed are passed on.
+        context = multiprocessing.get_context('spawn')
+        level = logging.getLogger('afd').getEffectiveLevel()
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                 initializer=setup_logging,
+                                 initargs=(level,)) as pool:
+            window = 2 * processes
+            pending = collections.deque()
+            for url, download in downloads:
+                while pending:
+                    if len(pending) < window:
+                        wait((pending[0], download),
+                             return_when=FIRST_COMPLETED)
+                        if not pending[0].done():
+                            break
+                    yield from pending.popleft().result()
+                pending.append(
+                    pool.submit(parse_log_page, url, download.result()))
+            while pending:
+                yield from pending.popleft().result()
+
+
+def afd_bios(root_url):
     """This yields Entry-Link-Hits tuples for the suspected bios."""
-    for link in get_afd_index(root_url, parser):
-        yield from get_log_page(link, parser)
+    yield from get_log_pages(get_afd_index(root_url))
 
 
+@functools.lru_cache(maxsize=4096)
 def make_day_link(date):
     """Returns a link for the AfD's for a given day."""
     return ('https://en.wikipedia.org/wiki/'
@@ -334,49 +680,64 @@ def make_day_link(date):
                 ))
 
 
-def in_week(cal, cache, week_num, date):
+@functools.lru_cache(maxsize=None)
+def week_dates(year, month, week_num):
     """\
-    Returns True if date is in week # week_num.
+    Returns the set of dates in week # week_num of the month.
+
+    Weeks begin with Sunday. Week 0 is the week containing the first of the
+    month, and week 1 is the first full week, which is the same week if the
+    month begins on a Sunday.
+    """
+    cal = calendar.Calendar(firstweekday=6)
+    month = cal.itermonthdates(year, month)
+
+    current_week = list(islice(month, 7))
+    if week_num > 0 and current_week[0].day <= 7:
+        week_num -= 1
+    for _ in range(week_num):
+        current_week = list(islice(month, 7))
 
-    The calculations are based off of the calendar passed in, and work
-    that might apply to this calculation on other dates are stored in the
-    cache.
+    return frozenset(current_week)
+
+
+def in_week(week_num, date):
+    """\
+    Returns True if date is in week # week_num.
 
-    >>> cal = calendar.Calendar()
-    >>> cache = {}
     >>> jul1 = datetime.date(2017, 7, 1)
-    >>> [in_week(cal, cache, week, jul1) for week in range(6)]
+    >>> [in_week(week, jul1) for week in range(6)]
     [True, False, False, False, False, False]
     >>> jul4 = datetime.date(2017, 7, 4)
-    >>> [in_week(cal, cache, week, jul4) for week in range(6)]
+    >>> [in_week(week, jul4) for week in range(6)]
     [False, True, False, False, False, False]
     >>> jul12 = datetime.date(2017, 7, 12)
-    >>> [in_week(cal, cache, week, jul12) for week in range(6)]
+    >>> [in_week(week, jul12) for week in range(6)]
     [False, False, True, False, False, False]
     >>> jul20 = datetime.date(2017, 7, 20)
-    >>> [in_week(cal, cache, week, jul20) for week in range(6)]
+    >>> [in_week(week, jul20) for week in range(6)]
     [False, False, False, True, False, False]
     >>> jul28 = datetime.date(2017, 7, 28)
-    >>> [in_week(cal, cache, week, jul28) for week in range(6)]
+    >>> [in_week(week, jul28) for week in range(6)]
     [False, False, False, False, True, False]
     >>> jul31 = datetime.date(2017, 7, 31)
-    >>> [in_week(cal, cache, week, jul31) for week in range(6)]
+    >>> [in_week(week, jul31) for week in range(6)]
     [False, False, False, False, False, True]
     """
-    key = (date.year, date.month, week_num)
+    return date in week_dates(date.year, date.month, week_num)
 
-    if key not in cache:
-        month = cal.itermonthdates(date.year, date.month)
 
-        current_week = list(islice(month, 7))
-        if week_num > 0 and current_week[0].day <= 7:
-            week_num -= 1
-        for _ in range(week_num):
-            current_week = list(islice(month, 7))
-
-        cache[key] = set(current_week)
+def iter_days(start_date, end_date):
+    """\
+    Iterate over the days from start_date up to, but not including, end_date.
 
-    return date in cache[key]
+    >>> list(iter_days(datetime.date(2017, 7, 30), datetime.date(2017, 8, 2)))
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [datetime.date(2017, 7, 30), datetime.date(2017, 7, 31),
+     datetime.date(2017, 8, 1)]
+    """
+    for offset in range((end_date - start_date).days):
+        yield start_date + datetime.timedelta(days=offset)
 
 
 def iter_first_weeks(start_date, end_date):
@@ -403,11 +764,21 @@ def iter_first_weeks(start_date, end_date):
             current = current.replace(month=current.month+1)
 
 
-def afd_weeklies(start_date, end_date, parser):
+def afd_weeklies(start_date, end_date):
     """Generate weekly AfDs for the first week of each month."""
-    for day in iter_first_weeks(start_date, end_date):
-        url = make_day_link(day)
-        yield from get_log_page(url, parser)
+    urls = (make_day_link(day)
+            for day in iter_first_weeks(start_date, end_date))
+    yield from get_log_pages(urls)
+
+
+def open_output(filename):
+    """\
+    Opens filename for writing CSV. If it ends in .gz, it's compressed on the
+    way out, with the fastest compression level.
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'wt', compresslevel=1, newline='')
+    return open(filename, 'w', buffering=1 << 20, newline='')
 
 
 class DateRange(click.ParamType):
@@ -436,53 +807,59 @@ class DateRange(click.ParamType):
               type=click.Choice(['CRITICAL', 'ERROR', 'WARNING', 'INFO',
                                  'DEBUG']))
 @click.option('--output', '-o', default=None,
-              help='The output file. It defaults to afd-bios-DATE.csv.')
+              help='The output file. It defaults to afd-bios-DATE.csv. If '
+                   'it ends in .gz, it is gzipped.')
+@click.option('--workers', '-j', default=WORKERS, type=int,
+              help='The number of log pages to download at once. '
+                   'Defaults to {}.'.format(WORKERS))
+@click.option('--processes', '-p', default=PROCESSES, type=int,
+              help='The number of processes to parse log pages on. '
+                   'Defaults to the number of CPUs.')
+@click.option('--cache', '-c', default=None,
+              help='A directory to cache the log pages in between runs. '
+                   'Cached pages are only downloaded again if they have '
+                   'changed.')
 @click.option('--test', '-t', is_flag=True,
               help='Run doctests on the functions instead of scraping '
                    'Wikipedia.')
-def main(date, date_range, week, level, output, test):
+def main(date, date_range, week, level, output, workers, processes, cache,
+         test):
     """Download AfDs for a date or range."""
-    logging.basicConfig()
-    logging.getLogger('afd').setLevel(getattr(logging, level))
+    setup_logging(getattr(logging, level))
 
     if test:
         import doctest
         failure_count, test_count = doctest.testmod()
         raise SystemExit(failure_count)
 
-    parser = etree.HTMLParser()
     day = datetime.timedelta(days=1)
 
     if date and date_range is None:
         date_range = (date, date + day)
 
     if date_range:
-        current, end = date_range
-        date = current
-        dates = []
-        while current < end:
-            dates.append(current.date())
-            current += day
+        start, end = date_range
+        date = start
+        dates = iter_days(start.date(), end.date())
 
         if week:
-            cal = calendar.Calendar(firstweekday=6)
-            week_cache = {}
-            dates = (date for date in dates
-                     if in_week(cal, week_cache, week, date))
+            dates = (date for date in dates if in_week(week, date))
 
         links = (make_day_link(date) for date in dates)
 
     else:
-        links = get_afd_index(INDEX_URI, parser)
+        links = get_afd_index(INDEX_URI)
 
     if output is None:
         output = OUTPUT.format(date.strftime('%Y%m%d'))
 
-    with open(output, 'w') as fout:
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+
+    with open_output(output) as fout:
         writer = csv.writer(fout)
         writer.writerow(HEADER)
-        for link in links:
-            writer.writerows(get_log_page(link, parser))
+        writer.writerows(get_log_pages(links, workers, cache, processes))
 
 
 if __name__ == '__main__':
@@ -2,16 +2,16 @@
 
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import datetime
 from itertools import dropwhile, takewhile
-from urllib.parse import urljoin
 
 import click
 from click_datetime import Datetime
 from lxml import etree
 
-from afd import get_content
+from afd import get_content, join_uri, open_output
 
 
 HEADER = ('title', 'user', 'timestamp', 'url', 'original', 'history')
@@ -19,55 +19,81 @@ NewPageInfo = namedtuple('NewPageInfo', HEADER)
 
 DATE = datetime.date(2017, 3, 11)
 
+TIME_FORMAT = '%H:%M, %d %B %Y'
+
+FIRST_TIME = etree.XPath('(.//span[@class="mw-newpages-time"])[1]/text()')
+LAST_TIME = etree.XPath(
+    '(.//span[@class="mw-newpages-time"])[last()]/text()')
+LISTS = etree.XPath('.//ul')
+NEXT_LINK = etree.XPath('(.//a[@class="mw-nextlink"])[1]/@href')
+
+
+def read_new_page(url, li):
+    """\
+    This reads the information about one new page out of its list item.
+
+    Everything is picked up in a single pass over the item's links and
+    spans.
+    """
+    original = page = time = history = user = None
+
+    for el in li.iter('a', 'span'):
+        cls = el.get('class', '')
+        parent = el.getparent()
+        if el.tag == 'span':
+            if time is None and cls == 'mw-newpages-time':
+                time = el
+            continue
+
+        if parent is li:
+            if original is None:
+                original = el
+            if page is None and cls == 'mw-newpages-pagename':
+                page = el
+        elif (history is None and parent.tag == 'span' and
+              parent.get('class') == 'mw-newpages-history' and
+              parent.getparent() is li):
+            history = el
+        if user is None and 'mw-userlink' in cls.split():
+            user = el
+
+        if None not in (original, page, time, history, user):
+            break
+
+    if user is None:
+        raise ValueError('Missing user.')
+
+    return NewPageInfo(
+        original.get('title'),
+        user.text,
+        datetime.datetime.strptime(time.text, TIME_FORMAT),
+        join_uri(url, page.get('href')),
+        join_uri(url, original.get('href')),
+        join_uri(url, history.get('href')),
+        )
+
 
 def iter_new_pages(url, content):
     """This iterates over all the new pages listed in content."""
-    for i, ul in enumerate(content.findall('.//ul')):
+    for i, ul in enumerate(LISTS(content)):
         if i == 0:
             continue
-        for li in ul.findall('li'):
+        for li in ul.iterchildren('li'):
             try:
-                a_tag = li.find('a')
-                title = a_tag.get('title')
-                original = urljoin(url, a_tag.get('href'))
-
-                time = datetime.datetime.strptime(
-                    li.find('.//span[@class="mw-newpages-time"]').text,
-                    '%H:%M, %d %B %Y',
-                    )
-
-                a_tag = li.find('a[@class="mw-newpages-pagename"]')
-                page_url = urljoin(url, a_tag.get('href'))
-
-                user = None
-                for a_tag in li.findall('.//a'):
-                    class_set = set(a_tag.get('class', '').split())
-                    if 'mw-userlink' in class_set:
-                        user = a_tag.text
-                        break
-                else:
-                    raise "Missing user."
-
-                history = urljoin(
-                    url,
-                    li.find('span[@class="mw-newpages-history"]/a').get('href')
-                    )
-
+                info = read_new_page(url, li)
             except:
                 print('ERROR ON')
                 print(etree.tostring(li))
                 raise
 
-            yield NewPageInfo(title, user, time, page_url, original,
-                              history)
+            yield info
 
 
 def get_next(url, content):
     """This returns the link to the next page in content."""
-    a_tag = content.find('.//a[@class="mw-nextlink"]')
-    if a_tag is not None:
-        href = a_tag.get('href')
-        return urljoin(url, href)
+    hrefs = NEXT_LINK(content)
+    if hrefs:
+        return join_uri(url, hrefs[0])
     else:
         return None
 
@@ -88,16 +114,49 @@ def make_day_link(date):
                 next_day.strftime('%Y%m%d')))
 
 
-def get_new(url, parser):
+def page_dates(content):
+    """\
+    This returns the dates of the newest and oldest pages listed in
+    content, or None if it doesn't list any.
+    """
+    first = FIRST_TIME(content)
+    last = LAST_TIME(content)
+    if not first or not last:
+        return None
+    return (datetime.datetime.strptime(first[0], TIME_FORMAT).date(),
+            datetime.datetime.strptime(last[0], TIME_FORMAT).date())
+
+
+def get_new(url, date=None):
     """\
     While the page is for the given date, download the new pages
     starting from url.
+
+    The pages are newest first, so pages that only list pages newer
+    than date are skipped without reading their rows, and nothing
+    after the first page listing older ones is downloaded.
+
+    Each page is downloaded in the background while the rows on the
+    page before it are being read.
     """
-    content = get_content(url, parser)
-    yield from iter_new_pages(url, content)
-    next_page = get_next(url, content)
-    if next_page is not None:
-        yield from get_new(next_page, parser)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(get_content, url)
+        while future is not None:
+            content = future.result()
+            dates = page_dates(content) if date is not None else None
+            if dates is not None and dates[0] < date:
+                break
+
+            next_page = get_next(url, content)
+            if next_page is not None and (dates is None or
+                                          dates[1] >= date):
+                future = executor.submit(get_content, next_page)
+            else:
+                future = None
+
+            if dates is None or dates[1] <= date:
+                yield from iter_new_pages(url, content)
+            url = next_page
 
 
 @click.command()
@@ -106,7 +165,8 @@ def get_new(url, parser):
               help='The date to get new articles for. The format '
                    'is YYYY-MM-DD. Defaults to today.')
 @click.option('--output', '-o', default=None,
-              help='The output file. It default to new-DATE.csv.')
+              help='The output file. It default to new-DATE.csv. If it '
+                   'ends in .gz, it is gzipped.')
 def main(date, output):
     """Scrapes links to all new pages generated on a date."""
     if date is None:
@@ -117,14 +177,13 @@ def main(date, output):
     if output is None:
         output = 'new-{}.csv'.format(date.strftime('%Y%m%d'))
 
-    parser = etree.HTMLParser()
-    with open(output, 'w') as fout:
+    with open_output(output) as fout:
         writer = csv.writer(fout)
         writer.writerow(NewPageInfo._fields)
 
         url = make_day_link(date)
-        rows = get_new(url, parser)
-        rows = dropwhile(lambda r: r.timestamp.date() < date, rows)
+        rows = get_new(url, date)
+        rows = dropwhile(lambda r: r.timestamp.date() > date, rows)
         rows = takewhile(lambda r: r.timestamp.date() == date, rows)
         writer.writerows(rows)
 
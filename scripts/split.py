@@ -1,17 +1,15 @@
 #!/usr/bin/env python3
 
 
+import contextlib
 import csv
-import itertools
-import operator
 
 import click
 
 
 def get_year_month(row):
     date = row[0]
-    year, month, _ = date.split('-')
-    return (year, month)
+    return (date[:4], date[5:7])
 
 
 @click.command()
@@ -24,15 +22,19 @@ def main(input, output):
     input_rows = csv.reader(input)
 
     header = next(input_rows)
-    input_rows = list(input_rows)
-
-    input_rows.sort(key=operator.itemgetter(0))
-    for (key, month_rows) in itertools.groupby(input_rows, key=get_year_month):
-        output_filename = output.format(*key)
-        with open(output_filename, 'w') as fout:
-            writer = csv.writer(fout)
-            writer.writerow(header)
-            writer.writerows(month_rows)
+
+    writers = {}
+    with contextlib.ExitStack() as stack:
+        for row in input_rows:
+            key = get_year_month(row)
+            writer = writers.get(key)
+            if writer is None:
+                output_filename = output.format(*key)
+                fout = stack.enter_context(open(
+                    output_filename, 'w', buffering=1 << 16, newline=''))
+                writer = writers[key] = csv.writer(fout)
+                writer.writerow(header)
+            writer.writerow(row)
 
 
 if __name__ == "__main__":